@@ -2,9 +2,23 @@
 import streamlit as st
 import time
 
-from utils.file_processor import *
-from utils.llm_agent import *
-from utils.structured_db import *
+# Heavy dependencies (langchain, PIL, requests, tinydb, rapidfuzz) are imported by these
+# modules on first use, so the page can render before they are loaded
+from utils.file_processor import format_ocr_to_json, ocr_router, process_uploaded_file
+from utils.llm_agent import LLM_ERROR_RESPONSE, OFFTOPIC_RESPONSE, analyze_with_llm
+from utils.structured_db import (
+    add_patient_info,
+    add_prescription,
+    get_active_medications,
+    get_patient_by_id,
+    get_prescriptions_for_patient,
+    search_patients,
+    update_patient_info,
+    with_active_medications,
+)
+from utils.answer_cache import answer_cache
+from utils.ocr_reuse import ocr_reuse_index
+from utils.incremental_analysis import ANALYSES, update_analyses
 
 from evalmetrics.config import EVAL_MODE
 from evalmetrics.ground_truth import get_ground_truths
@@ -28,15 +42,95 @@ if "messages" not in st.session_state:
     st.session_state.messages = []
 if "file_processed" not in st.session_state:
     st.session_state.file_processed = False
+if "analyses" not in st.session_state:
+    st.session_state.analyses = {}
+if "pending_history" not in st.session_state:
+    st.session_state.pending_history = None
+
+if "patient_id" not in st.session_state:
+    st.session_state.patient_id = None
+
+
+def switch_patient(patient_id, force=False):
+    """
+    Select another patient, dropping everything the session holds for the previous one
+    so it cannot be shown to, saved into or appended to the history of the new patient
+    """
+    if patient_id == st.session_state.patient_id and not force:
+        return
+    st.session_state.patient_id = patient_id
+    st.session_state.extracted_text = None
+    st.session_state.analyses = {}
+    for name in ANALYSES:
+        st.session_state[name] = None
+    st.session_state.messages = []
+    st.session_state.pending_history = None
+    # A file still sitting in the uploader belongs to the previous patient: do not process it again
+    st.session_state.file_processed = True
+
+# Patient selection - each session works on its own patient
+with st.sidebar:
+    st.header("Patient")
+    patient_query = st.text_input("Search patients", placeholder="Start typing a name")
+    if patient_query:
+        matches = dict(search_patients(patient_query))
+        if matches:
+            selected_id = st.selectbox("Matching patients", list(matches), format_func=matches.get)
+            if st.button("Load patient"):
+                switch_patient(selected_id)
+        else:
+            st.caption("No matching patients.")
+    if st.button("New patient"):
+        switch_patient(None, force=True)
 
 # Get the patient info if exists
-patient_info = get_patient_by_name("Armande Cegna")
+patient_info = get_patient_by_id(st.session_state.patient_id) if st.session_state.patient_id else None
 if patient_info:
-    info = patient_info[0]
-    st.info("Patient information loaded from database.")
+    info = patient_info
+    st.info(f"Patient information loaded from database: {info.get('name', '')}")
 else:
     info = {"name":"", "age": "", "allergies": "", "conditions": "", "surgery_history": "", "medications": ""}
 
+# Restore the last analysed prescription of this patient so a page reload recomputes nothing
+if patient_info and st.session_state.extracted_text is None and patient_info.get("analyses"):
+    st.session_state.extracted_text = patient_info.get("extracted_text")
+    st.session_state.analyses = patient_info["analyses"]
+
+
+def refresh_analyses(status, info):
+    """
+    Re-run only the analyses whose inputs (OCR text, allergies, conditions, medications) changed
+    """
+    extracted_text = st.session_state.extracted_text
+    if not extracted_text or extracted_text == "Could not extract text from image":
+        for name in ANALYSES:
+            st.session_state[name] = None
+        return
+    analysis_info = info
+    if st.session_state.patient_id:
+        # Check the prescription against drugs from the patient's earlier prescriptions too
+        active_medications = get_active_medications(st.session_state.patient_id, exclude_ocr_text=extracted_text)
+        analysis_info = with_active_medications(info, active_medications)
+    results, recomputed = update_analyses(
+        extracted_text, analysis_info, st.session_state.analyses,
+        on_recompute=lambda label: status.info(f"⏳ Analyzing {label}...")
+    )
+    st.session_state.analyses = results
+    for name, entry in results.items():
+        st.session_state[name] = entry["result"]
+    if recomputed:
+        status.success(f"✅ Updated {', '.join(ANALYSES[name][0] for name in recomputed)} analysis")
+    # Persist alongside the patient
+    if st.session_state.patient_id and (recomputed or info.get("analyses") != results):
+        update_patient_info(st.session_state.patient_id, {"extracted_text": extracted_text, "analyses": results})
+    # Append a newly uploaded prescription to the patient's history once it has been analysed
+    if st.session_state.patient_id and st.session_state.pending_history:
+        add_prescription(
+            st.session_state.patient_id, extracted_text, format_ocr_to_json(extracted_text),
+            results, file_name=st.session_state.pending_history
+        )
+        st.session_state.pending_history = None
+
 
 # Left Sidebar - File Upload Only
 with st.sidebar:
@@ -57,11 +151,10 @@ with st.sidebar:
         st.success(f"Uploaded: {uploaded_file.name}")
         # Create progress containers
         extraction_status = st.empty()
-        analysis_status = st.empty()
         
         # Step 1: Extraction
         extraction_status.info("⏳ Extracting text from image...")
-        extracted_text = process_uploaded_file(uploaded_file)
+        extracted_text = process_uploaded_file(uploaded_file, patient_id=st.session_state.patient_id)
         st.session_state.extracted_text = extracted_text
         time.sleep(0.5)
         extraction_status.success("✅ Extraction complete!")
@@ -70,48 +163,11 @@ with st.sidebar:
         print(extracted_text)
         print ("-----------------------------")
 
-        # Step 2: Analysis (only if extraction worked)
-        if extracted_text and extracted_text != "Could not extract text from image":
-            analysis_status.info("⏳ Analyzing prescription...")
-            formatted_summary = format_prescription_with_llm(extracted_text)
-            st.session_state.formatted_summary = formatted_summary
-            time.sleep(0.5)
-            analysis_status.success("✅ Analysis complete!")
-        else:
-            st.session_state.formatted_summary = None
-            analysis_status.warning("❌ Cannot analyze - extraction failed")
-        
-        if extracted_text and extracted_text != "Could not extract text from image":
-            analysis_status.info("⏳ Analyzing allergies...")
-            formatted_summary =  analyze_personal_allergies_with_llm(extracted_text,info.get("allergies", ""))
-            st.session_state.formatted_allergy_summary = formatted_summary
-            time.sleep(0.25)
-            analysis_status.success("✅ Allergies Alerts complete!")
+        if not extracted_text or extracted_text == "Could not extract text from image":
+            extraction_status.warning("❌ Cannot analyze - extraction failed")
+            st.session_state.pending_history = None
         else:
-            st.session_state.formatted_allergy_summary = None
-            analysis_status.warning("❌ Cannot analyze allergies - extraction failed")
-
-        if extracted_text and extracted_text != "Could not extract text from image":
-            analysis_status.info("⏳ Analyzing Pre Existing Conditions ...")
-            formatted_summary =  analyze_personal_preexistingconditions_with_llm(extracted_text,info.get("conditions", ""))
-            st.session_state.formatted_preexist_summary = formatted_summary
-            time.sleep(0.25)
-            analysis_status.success("✅ Pre Existing Conditions Alerts complete!")
-        else:
-            st.session_state.formatted_preexist_summary = None
-            analysis_status.warning("❌ Cannot analyze Pre Existing Conditions - extraction failed")
-
-        if extracted_text and extracted_text != "Could not extract text from image":
-            analysis_status.info("⏳ Analyzing Drug Interactions ...")
-            formatted_summary =  analyze_personal_drug_interactions_with_llm(extracted_text, info.get("medications", ""))
-            st.session_state.formatted_drug_interactions_summary = formatted_summary
-            time.sleep(0.25)
-            analysis_status.success("✅ Pre Existing Conditions Alerts complete!")
-        else:
-            st.session_state.formatted_drug_interactions_summary = None
-            analysis_status.warning("❌ Cannot analyze Pre Existing Conditions - extraction failed")
-
-
+            st.session_state.pending_history = uploaded_file.name
 
         # Mark file as processed to prevent re-processing on chat interactions
         st.session_state.file_processed = True
@@ -126,13 +182,36 @@ with st.sidebar:
                 json_output = format_ocr_to_json(st.session_state.extracted_text)
                 score = evaluate_json(json_output, gt)
                 st.write(f"Evaluation score (offline): {score}")
+                # Score every OCR backend on this image to compare speed and accuracy
+                backend_scores = ocr_router.record_accuracy(uploaded_file, gt)
+                st.write(f"OCR backend accuracy (offline): {backend_scores}")
             else:
                 st.warning("No ground truth defined for this Rx file.")
 
+    # Analyses run after the patient form so that edits are picked up in the same run
+    analysis_status = st.empty()
+
+    if EVAL_MODE:
+        cache_stats = answer_cache.stats()
+        st.caption(f"Answer cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses "
+                   f"(hit rate {cache_stats['hit_rate']:.0%}, {cache_stats['evictions']} evicted)")
+        reuse_stats = ocr_reuse_index.stats()
+        if ocr_router.local_available():
+            st.caption(f"OCR reuse: {reuse_stats['api_calls_avoided']} of {reuse_stats['lookups']} uploads "
+                       f"matched a previous photo (OCR API calls avoided)")
+        else:
+            st.caption("OCR reuse: off (needs a local OCR backend: pytesseract and the tesseract binary)")
+        for backend, backend_stats in ocr_router.stats().items():
+            st.caption(f"OCR {backend}: {backend_stats['calls']} calls, {backend_stats['failures']} failed, "
+                       f"mean latency {backend_stats['mean_latency']}s, mean accuracy {backend_stats['mean_accuracy']}")
+        recommended_backend = ocr_router.choose_backend()
+        if recommended_backend:
+            st.caption(f"Fastest accurate OCR backend: {recommended_backend}")
+
 # Main Area - Chat Interface
 # --- Patient Information Input ---
 with st.expander("📝 Patient Information", expanded=True):
-    tab0, tab1, tab2, tab3, tab4 = st.tabs(["📝 Enter / Update Patient Information", "📋 Prescription Analysis", "Allergy Analysis", "Pre Existing Conditions Analysis", "Drug Interactions Analysis"])
+    tab0, tab1, tab2, tab3, tab4, tab5 = st.tabs(["📝 Enter / Update Patient Information", "📋 Prescription Analysis", "Allergy Analysis", "Pre Existing Conditions Analysis", "Drug Interactions Analysis", "🗂️ Prescription History"])
 #st.header("Medical Assistant Chat")
 
 # Display FORMATTED summary in main area if available
@@ -155,7 +234,7 @@ with tab0:
         if submit_info:
             st.success("Patient information submitted!")
             st.session_state.patient_info = {
-                "name": "Armande Cegna",
+                "name": name,
                 "age": age,
                 "allergies": allergies,
                 "conditions": conditions,
@@ -164,12 +243,14 @@ with tab0:
             }
             if patient_info:
                 # Update existing record
-                doc_id = patient_info[0].doc_id if hasattr(patient_info[0], 'doc_id') else patient_info[0].get('doc_id')
-                update_patient_info(doc_id, st.session_state.patient_info)
+                update_patient_info(patient_info.doc_id, st.session_state.patient_info)
             else:
-                # Add new record
-                add_patient_info(st.session_state.patient_info)
+                # Add new record and keep working on it in this session
+                st.session_state.patient_id = add_patient_info(st.session_state.patient_info)
             st.json(st.session_state.patient_info)
+            info = st.session_state.patient_info
+
+refresh_analyses(analysis_status, info)
 
 with tab1:
     if st.session_state.formatted_summary:
@@ -191,6 +272,16 @@ with tab4:
         st.markdown(st.session_state.formatted_drug_interactions_summary)
     else:
         st.info("No drug interactions analysis available. Please upload a prescription image.")
+with tab5:
+    history = get_prescriptions_for_patient(st.session_state.patient_id) if st.session_state.patient_id else []
+    if history:
+        for record in reversed(history):
+            drugs = ", ".join(drug.get("drug_name", "") for drug in record["structured"].get("drugs", []))
+            with st.expander(f"{record['created_at']} - {record.get('file_name') or 'prescription'}"):
+                st.markdown(f"**Drugs:** {drugs or 'none detected'}")
+                st.text(record["ocr_text"])
+    else:
+        st.info("No prescription history for this patient.")
 
 
 
@@ -233,7 +324,11 @@ if prompt := st.chat_input("What would you like to know about this prescription?
             #     response = analyze_with_llm(prompt, st.session_state.extracted_text)
             # else:
             #     response = "Please upload a prescription image first."
-            response = analyze_with_llm(prompt, st.session_state.extracted_text)
+            response = answer_cache.get(prompt, st.session_state.extracted_text)
+            if response is None:
+                response = analyze_with_llm(prompt, st.session_state.extracted_text)
+                if response not in (LLM_ERROR_RESPONSE, OFFTOPIC_RESPONSE):
+                    answer_cache.put(prompt, st.session_state.extracted_text, response)
         st.markdown(response)
         st.session_state.messages.append({"role": "assistant", "content": response})
 
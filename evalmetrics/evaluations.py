@@ -1,5 +1,4 @@
 from typing import Dict
-from rapidfuzz import fuzz
 
 def evaluate_json(predicted: Dict, ground_truth: Dict) -> Dict:
     """
@@ -13,6 +12,7 @@ def evaluate_json(predicted: Dict, ground_truth: Dict) -> Dict:
     Returns:
         Dict: Evaluation scores with field-wise comparison and overall accuracy.
     """
+    from rapidfuzz import fuzz
 
     # Fuzzy matching for basic fields
     results = {
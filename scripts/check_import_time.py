@@ -0,0 +1,87 @@
+# scripts/check_import_time.py
+"""
+Import-time budget for the app's own modules (everything app.py imports besides streamlit).
+
+Runs `python -X importtime` in a fresh interpreter and fails (exit code 1) when
+- the total import time exceeds the budget, or
+- a heavy dependency that should be loaded on first use is imported at startup.
+
+Usage:
+    python scripts/check_import_time.py [--budget-ms 150] [--runs 5]
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+# Imported by app.py at startup
+APP_MODULES = [
+    "utils.file_processor",
+    "utils.llm_agent",
+    "utils.structured_db",
+    "utils.answer_cache",
+    "utils.ocr_reuse",
+    "utils.incremental_analysis",
+    "evalmetrics.config",
+    "evalmetrics.ground_truth",
+    "evalmetrics.evaluations",
+]
+# Must only be imported on first use, never at startup
+LAZY_MODULES = ["langchain_openai", "langchain_core", "PIL", "requests", "tinydb", "rapidfuzz", "pytesseract"]
+DEFAULT_BUDGET_MS = 150
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure_import_time():
+    """
+    Import the app modules once in a fresh interpreter.
+
+    Returns:
+        tuple: (total cumulative import time in ms, {module: cumulative ms} for every imported module)
+    """
+    code = "import " + ", ".join(APP_MODULES)
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=REPO_ROOT, capture_output=True, text=True, check=True
+    )
+    total_us = 0
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        modules[name.strip()] = int(cumulative) / 1000
+        # Top-level entries are not indented; their cumulative times add up to the total
+        if not name[1:].startswith(" "):
+            total_us += int(cumulative)
+    return total_us / 1000, modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    parser.add_argument("--runs", type=int, default=5, help="best of N runs, to reduce noise")
+    args = parser.parse_args()
+
+    runs = [measure_import_time() for _ in range(args.runs)]
+    total_ms, modules = min(runs, key=lambda run: run[0])
+
+    failed = False
+    eager = [name for name in LAZY_MODULES if name in modules]
+    if eager:
+        print(f"FAIL: imported at startup, should be loaded on first use: {', '.join(eager)}")
+        failed = True
+
+    print(f"App module import time: {total_ms:.1f} ms (budget {args.budget_ms:.0f} ms, best of {args.runs})")
+    for name in APP_MODULES:
+        print(f"  {name:<32} {modules.get(name, 0):8.1f} ms")
+    if total_ms > args.budget_ms:
+        print("FAIL: import time over budget")
+        failed = True
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,64 @@
+from utils.answer_cache import AnswerCache
+
+RX = "Amoxicillin, 500mg, Take twice daily"
+
+
+def make_cache():
+    cache = AnswerCache()
+    cache.put("What is this for?", RX, "answer: purpose")
+    cache.put("Can I take it with food?", RX, "answer: with food")
+    cache.put("Side effects?", RX, "answer: side effects")
+    return cache
+
+
+def test_paraphrases_hit():
+    cache = make_cache()
+    assert cache.get("whats this for?", RX) == "answer: purpose"
+    assert cache.get("what is it for", RX) == "answer: purpose"
+    assert cache.get("any side effects?", RX) == "answer: side effects"
+    assert cache.get("what are the side effects?", RX) == "answer: side effects"
+    assert cache.get("can I take this with food", RX) == "answer: with food"
+
+
+def test_negations_and_different_questions_miss():
+    cache = make_cache()
+    assert cache.get("Can I take it without food?", RX) is None
+    assert cache.get("Can I not take it with food?", RX) is None
+    assert cache.get("What is the dose for this?", RX) is None
+    assert cache.get("How do I take it?", RX) is None
+
+
+def test_scoped_per_prescription_and_counted():
+    cache = make_cache()
+    assert cache.get("What is this for?", "Ibuprofen, 200mg") is None
+    assert cache.get("What is this for?", RX) == "answer: purpose"
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 1
+
+
+def test_added_qualifiers_miss():
+    cache = make_cache()
+    cache.put("How much should I take?", RX, "answer: adult dose")
+    assert cache.get("how much should i take", RX) == "answer: adult dose"
+    # dose / population
+    assert cache.get("How much should I take for a child?", RX) is None
+    assert cache.get("How much should my child take?", RX) is None
+    assert cache.get("How much should I take if I am pregnant?", RX) is None
+    # quantity
+    assert cache.get("Can I take two with food?", RX) is None
+
+
+def test_questions_without_content_are_not_cached():
+    cache = make_cache()
+    for question in ("What?", "What is it?", "What are these?"):
+        assert cache.get(question, RX) is None
+    cache.put("What is it?", RX, "answer: vague")
+    assert cache.stats()["questions"] == 3
+
+
+def test_nothing_cached_without_prescription():
+    cache = AnswerCache()
+    cache.put("What is this for?", None, "answer: purpose")
+    cache.put("What is this for?", "", "answer: purpose")
+    assert cache.get("What is this for?", None) is None
+    assert cache.stats()["prescriptions"] == 0
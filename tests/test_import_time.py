@@ -0,0 +1,8 @@
+from scripts.check_import_time import DEFAULT_BUDGET_MS, LAZY_MODULES, measure_import_time
+
+
+def test_app_modules_import_within_budget_and_stay_lazy():
+    # Best of 3 fresh interpreters, as the script does, to reduce noise
+    total_ms, modules = min((measure_import_time() for _ in range(3)), key=lambda run: run[0])
+    assert [name for name in LAZY_MODULES if name in modules] == []
+    assert total_ms <= DEFAULT_BUDGET_MS
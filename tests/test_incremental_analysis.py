@@ -0,0 +1,56 @@
+from types import SimpleNamespace
+
+import pytest
+
+from utils import incremental_analysis
+from utils.incremental_analysis import update_analyses
+from utils.llm_agent import fallback_summary
+
+TEXT = "Amoxicillin, 500mg, Take twice daily"
+INFO = {"allergies": "Penicillin", "conditions": "Asthma", "medications": "Aspirin 100mg"}
+
+
+@pytest.fixture
+def llm(monkeypatch):
+    """Replace the LLM analyses with fakes; set llm.fail to simulate an outage."""
+    llm = SimpleNamespace(fail=False)
+
+    def fake(name):
+        def analyze(text, *rest):
+            return fallback_summary(text) if llm.fail else f"{name}: {rest}"
+        return analyze
+
+    for name, (label, _, get_inputs) in list(incremental_analysis.ANALYSES.items()):
+        monkeypatch.setitem(incremental_analysis.ANALYSES, name, (label, fake(name), get_inputs))
+    return llm
+
+
+def test_only_changed_inputs_are_recomputed(llm):
+    results, recomputed = update_analyses(TEXT, INFO, {})
+    assert len(recomputed) == 4
+    results, recomputed = update_analyses(TEXT, {**INFO, "allergies": "Sulfa"}, results)
+    assert recomputed == ["formatted_allergy_summary"]
+    _, recomputed = update_analyses(TEXT, {**INFO, "allergies": "Sulfa"}, results)
+    assert recomputed == []
+
+
+def test_failed_analysis_backs_off(llm):
+    llm.fail = True
+    results, recomputed = update_analyses(TEXT, INFO, {}, now=1000)
+    assert len(recomputed) == 4
+    assert all(entry["failed"] and entry["attempts"] == 1 for entry in results.values())
+
+    # Reruns before retry_at do not call the LLM again
+    results, recomputed = update_analyses(TEXT, INFO, results, now=1010)
+    assert recomputed == []
+
+    # After retry_at it is retried, with a longer delay if it fails again
+    results, recomputed = update_analyses(TEXT, INFO, results, now=1000 + incremental_analysis.RETRY_AFTER_SECONDS)
+    assert len(recomputed) == 4
+    assert results["formatted_summary"]["attempts"] == 2
+
+    # Changed inputs are recomputed right away, and a success clears the failure
+    llm.fail = False
+    results, recomputed = update_analyses(TEXT, {**INFO, "conditions": "None"}, results, now=1070)
+    assert recomputed == ["formatted_preexist_summary"]
+    assert "failed" not in results["formatted_preexist_summary"]
@@ -0,0 +1,130 @@
+import io
+
+import pytest
+from PIL import Image, ImageDraw, ImageEnhance, ImageFilter, ImageFont
+
+from utils import ocr_reuse
+from utils.ocr_reuse import OCRReuseIndex, hamming, image_hashes
+
+try:
+    FONT = ImageFont.load_default(size=22)
+except TypeError:  # Pillow < 10.1
+    FONT = ImageFont.load_default()
+
+
+def prescription(patient, date, drugs):
+    """A prescription written on the same clinic template."""
+    image = Image.new("RGB", (700, 900), "white")
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((20, 20, 680, 880), outline="black", width=4)
+    draw.rectangle((20, 20, 680, 140), fill=(40, 60, 120))
+    draw.text((40, 50), "CITY CLINIC - Dr Ketan Dave", fill="white", font=FONT)
+    draw.line((40, 200, 660, 200), fill="black", width=2)
+    draw.text((40, 160), f"Patient: {patient}", fill="black", font=FONT)
+    draw.text((420, 160), f"Date: {date}", fill="black", font=FONT)
+    for i, drug in enumerate(drugs):
+        draw.text((60, 240 + i * 50), drug, fill="black", font=FONT)
+    draw.text((420, 820), "Signature ______", fill="black", font=FONT)
+    return image
+
+
+def rephotographed(image):
+    """The same page photographed again: framed differently, brighter, slightly blurred."""
+    width, height = image.size
+    image = image.crop((10, 12, width - 6, height - 9)).resize((720, 930))
+    image = ImageEnhance.Brightness(image).enhance(1.15)
+    return image.filter(ImageFilter.GaussianBlur(0.8))
+
+
+def upload(image):
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=85)
+    buffer.seek(0)
+    return buffer
+
+
+FIRST_TEXT = "Patient: Prateek Goel Date: 2024-08-15\nAmoxicillin, 500mg, Take twice daily\nIbuprofen, 200mg, after meals"
+FIRST = prescription("Prateek Goel", "2024-08-15", ["Amoxicillin, 500mg, Take twice daily", "Ibuprofen, 200mg, after meals"])
+SECOND_TEXT = "Patient: Anita Rao Date: 2024-09-02\nMetformin, 850mg, once daily\nAtorvastatin, 20mg, at night"
+SECOND = prescription("Anita Rao", "2024-09-02", ["Metformin, 850mg, once daily", "Atorvastatin, 20mg, at night"])
+
+
+@pytest.fixture
+def index(monkeypatch):
+    """An empty reuse index that does not touch the database."""
+    monkeypatch.setattr(ocr_reuse, "get_ocr_hashes", lambda: [])
+    monkeypatch.setattr(ocr_reuse, "add_ocr_hash", lambda *args: None)
+    return OCRReuseIndex()
+
+
+def lookup(index, image, local_text, patient_id):
+    hashes = image_hashes(upload(image))
+    return index.confirm(index.candidates(hashes, patient_id), hashes, local_text)
+
+
+def test_rephotographed_prescription_is_reused(index):
+    index.add(image_hashes(upload(FIRST)), FIRST_TEXT, patient_id=1)
+    again = rephotographed(FIRST)
+    assert lookup(index, again, FIRST_TEXT, patient_id=1) == FIRST_TEXT
+    assert lookup(index, rephotographed(again), FIRST_TEXT, patient_id=1) == FIRST_TEXT
+    assert index.stats() == {"lookups": 2, "api_calls_avoided": 2}
+
+
+def test_different_prescriptions_on_same_template_do_not_match(index):
+    first, second = image_hashes(upload(FIRST)), image_hashes(upload(SECOND))
+    assert hamming(first[0], second[0]) <= ocr_reuse.DHASH_THRESHOLD  # the layout hash alone would match
+    index.add(first, FIRST_TEXT, patient_id=1)
+    candidates = index.candidates(second, patient_id=1)
+    assert candidates
+    # Even if the local OCR misread it with the same numbers, the ink map differs
+    assert index.confirm(candidates, second, FIRST_TEXT) is None
+    assert index.confirm(candidates, second, SECOND_TEXT) is None
+
+
+def test_one_digit_change_is_not_matched(index):
+    index.add(image_hashes(upload(FIRST)), FIRST_TEXT, patient_id=1)
+    new_dose = prescription("Prateek Goel", "2024-08-15", ["Amoxicillin, 250mg, Take twice daily", "Ibuprofen, 200mg, after meals"])
+    assert lookup(index, new_dose, FIRST_TEXT.replace("500mg", "250mg"), patient_id=1) is None
+
+
+def test_nothing_is_reused_without_local_ocr(index):
+    index.add(image_hashes(upload(FIRST)), FIRST_TEXT, patient_id=1)
+    assert lookup(index, FIRST, None, patient_id=1) is None
+
+
+def test_reuse_is_scoped_to_the_patient(index):
+    index.add(image_hashes(upload(FIRST)), FIRST_TEXT, patient_id=1)
+    assert index.candidates(image_hashes(upload(rephotographed(FIRST))), patient_id=2) == []
+    assert index.candidates(image_hashes(upload(FIRST)), patient_id=None) == []
+
+
+def test_records_without_patient_or_content_are_ignored(monkeypatch):
+    d_hash, _ = image_hashes(upload(FIRST))
+    monkeypatch.setattr(ocr_reuse, "get_ocr_hashes", lambda: [
+        {"dhash": f"{d_hash:016x}", "ahash": "0" * 16, "ocr_text": FIRST_TEXT},
+    ])
+    assert OCRReuseIndex().candidates(image_hashes(upload(FIRST)), patient_id=1) == []
+
+
+def test_local_ocr_runs_only_for_candidates(index, monkeypatch):
+    from utils import file_processor
+
+    local_runs = []
+    monkeypatch.setattr(ocr_reuse, "ocr_reuse_index", index)
+    monkeypatch.setattr(file_processor.ocr_router, "local_available", lambda: True)
+    monkeypatch.setattr(file_processor.ocr_router, "local_result", lambda image_file: local_runs.append(1) or (
+        file_processor.OCRResult(FIRST_TEXT, "tesseract", 90, True)
+    ))
+    monkeypatch.setattr(file_processor.ocr_router, "extract", lambda image_file, policy, local_result: (
+        file_processor.OCRResult(FIRST_TEXT, "mistral", None, True)
+    ))
+
+    def process(image):
+        uploaded = upload(image)
+        uploaded.type = "image/jpeg"
+        return file_processor.process_uploaded_file(uploaded, patient_id=1)
+
+    assert process(FIRST) == FIRST_TEXT
+    assert local_runs == []  # nothing indexed yet: no candidates, no local OCR
+    assert process(rephotographed(FIRST)) == FIRST_TEXT
+    assert local_runs == [1] and index.stats()["api_calls_avoided"] == 1
@@ -0,0 +1,100 @@
+import io
+import time
+
+import pytest
+
+from utils import file_processor
+from utils.file_processor import OCRBackend, OCRRouter
+from utils.settings import Settings
+
+
+class FakeBackend(OCRBackend):
+    def __init__(self, name, text, confidence=None, is_local=False, delay=0.0):
+        self.name = name
+        self.is_local = is_local
+        self.text = text
+        self.confidence = confidence
+        self.delay = delay
+        self.runs = 0
+
+    def extract(self, image_file):
+        return self.extract_with_confidence(image_file)[0]
+
+    def extract_with_confidence(self, image_file):
+        self.runs += 1
+        time.sleep(self.delay)
+        return self.text, self.confidence
+
+
+@pytest.fixture(autouse=True)
+def settings(monkeypatch):
+    monkeypatch.setattr(file_processor, "get_settings", lambda: Settings(
+        openai_api_key=None, mistral_api_key=None, ocr_policy="fallback", ocr_local_min_confidence=85,
+    ))
+
+
+def image():
+    return io.BytesIO(b"image")
+
+
+def test_race_waits_for_remote_when_local_is_not_confident():
+    router = OCRRouter([
+        FakeBackend("remote", "remote text", delay=0.05),
+        FakeBackend("local", "l0cal t3xt", confidence=40, is_local=True),
+    ])
+    result = router.extract(image(), "race")
+    assert (result.text, result.backend, result.trusted) == ("remote text", "remote", True)
+
+
+def test_race_accepts_confident_local_result():
+    router = OCRRouter([
+        FakeBackend("remote", "remote text", delay=0.05),
+        FakeBackend("local", "local text", confidence=95, is_local=True),
+    ])
+    result = router.extract(image(), "race")
+    assert (result.text, result.backend, result.confidence, result.trusted) == ("local text", "local", 95, True)
+
+
+@pytest.mark.parametrize("policy", ["local_first", "race", "fallback"])
+def test_low_confidence_local_text_is_untrusted_when_remote_fails(policy):
+    router = OCRRouter([
+        FakeBackend("remote", None),
+        FakeBackend("local", "l0cal t3xt", confidence=40, is_local=True),
+    ])
+    result = router.extract(image(), policy)
+    assert (result.text, result.backend, result.confidence, result.trusted) == ("l0cal t3xt", "local", 40, False)
+
+
+def test_untrusted_text_is_not_used_or_reused(monkeypatch):
+    from utils import ocr_reuse
+
+    added = []
+    monkeypatch.setattr(file_processor, "ocr_router", OCRRouter([
+        FakeBackend("remote", None),
+        FakeBackend("local", "l0cal t3xt", confidence=40, is_local=True),
+    ]))
+    monkeypatch.setattr(ocr_reuse, "image_hashes", lambda image_file: (0, None))
+    monkeypatch.setattr(ocr_reuse.ocr_reuse_index, "candidates", lambda *args: [])
+    monkeypatch.setattr(ocr_reuse.ocr_reuse_index, "add", lambda *args: added.append(args))
+    uploaded = image()
+    uploaded.type = "image/png"
+    assert file_processor.process_uploaded_file(uploaded, "local_first", patient_id=1) == "Could not extract text from image"
+    assert added == []
+
+
+def test_local_first_reuses_the_confirmation_result():
+    local = FakeBackend("local", "l0cal t3xt", confidence=40, is_local=True)
+    router = OCRRouter([FakeBackend("remote", "remote text"), local])
+    local_result = router.local_result(image())
+    assert local.runs == 1 and router.stats()["local"]["calls"] == 0  # confirmation runs are not counted
+    result = router.extract(image(), "local_first", local_result)
+    assert result.backend == "remote" and local.runs == 1
+    assert router.stats()["local"]["calls"] == 1 and router.stats()["remote"]["calls"] == 1
+
+
+def test_backend_without_extract_cannot_be_created():
+    class Incomplete(OCRBackend):
+        name = "incomplete"
+
+    with pytest.raises(TypeError):
+        Incomplete()
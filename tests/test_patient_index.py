@@ -0,0 +1,39 @@
+from utils.patient_index import PatientNameIndex
+
+
+class Record(dict):
+    def __init__(self, doc_id, name):
+        super().__init__(name=name)
+        self.doc_id = doc_id
+
+
+def make_index():
+    index = PatientNameIndex()
+    index.build([Record(1, "Armande Cegna"), Record(3, "WeCare User"), Record(4, "John Doe")])
+    return index
+
+
+def test_prefix_and_word_prefix():
+    index = make_index()
+    assert index.search("arm") == [(1, "Armande Cegna")]
+    assert index.search("ceg") == [(1, "Armande Cegna")]
+
+
+def test_typo_in_first_letter():
+    assert make_index().search("Kegna") == [(1, "Armande Cegna")]
+
+
+def test_typo_with_unfinished_last_word():
+    index = make_index()
+    assert index.search("armnde ceg") == [(1, "Armande Cegna")]
+    assert index.search("armnde c") == [(1, "Armande Cegna")]
+    assert index.search("joh d") == [(4, "John Doe")]
+
+
+def test_incremental_updates():
+    index = make_index()
+    index.update(4, "Jane Smith")
+    assert index.search("doe") == []
+    assert index.search("smyth") == [(4, "Jane Smith")]
+    index.remove(4)
+    assert index.search("smi") == []
@@ -0,0 +1,113 @@
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+from utils import structured_db
+from utils.structured_db import (
+    ACTIVE_MEDICATION_DAYS,
+    add_prescription,
+    get_active_medications,
+    get_prescriptions_by_drug,
+    get_prescriptions_for_patient,
+    with_active_medications,
+)
+
+NOW = datetime(2024, 9, 1, 12, 0, 0)
+
+
+class FakeDatetime(datetime):
+    """datetime whose now() can be moved, to date prescriptions."""
+    current = NOW
+
+    @classmethod
+    def now(cls, tz=None):
+        return cls.current
+
+
+@pytest.fixture(autouse=True)
+def db(tmp_path, monkeypatch):
+    """A fresh database file and empty prescription indexes for every test."""
+    monkeypatch.setattr(structured_db, "DB_PATH", str(tmp_path / "db.json"))
+    monkeypatch.setattr(structured_db, "_prescriptions_by_patient", {})
+    monkeypatch.setattr(structured_db, "_prescriptions_by_drug", {})
+    monkeypatch.setattr(structured_db, "_prescription_index_built", False)
+    monkeypatch.setattr(structured_db, "datetime", FakeDatetime)
+    FakeDatetime.current = NOW
+    structured_db._get_db.cache_clear()
+    yield
+    structured_db._get_db().close()
+    structured_db._get_db.cache_clear()
+
+
+def prescribe(patient_id, ocr_text, *drugs, days_ago=0):
+    FakeDatetime.current = NOW - timedelta(days=days_ago)
+    try:
+        structured = {"drugs": [{"drug_name": name, "dosage": dosage} for name, dosage in drugs]}
+        return add_prescription(patient_id, ocr_text, structured, {})
+    finally:
+        FakeDatetime.current = NOW
+
+
+def test_history_is_append_only_and_oldest_first():
+    prescribe(1, "first", ("Amoxicillin", "500mg"), days_ago=10)
+    prescribe(2, "other patient", ("Metformin", "850mg"))
+    prescribe(1, "second", ("Amoxicillin", "500mg"))
+    history = get_prescriptions_for_patient(1)
+    assert [r["ocr_text"] for r in history] == ["first", "second"]
+    assert history[0]["created_at"] < history[1]["created_at"]
+    assert get_prescriptions_for_patient(3) == []
+
+
+def test_drug_index_normalizes_names():
+    prescribe(1, "first", ("Amoxicillin ", "500mg"))
+    prescribe(2, "second", ("AMOXICILLIN", "250mg"), ("Ibuprofen", "200mg"))
+    assert [r["ocr_text"] for r in get_prescriptions_by_drug("  amoxicillin")] == ["first", "second"]
+    assert [r["ocr_text"] for r in get_prescriptions_by_drug("Amoxicillin", patient_id=2)] == ["second"]
+    assert get_prescriptions_by_drug("Aspirin") == []
+
+
+def test_index_is_rebuilt_from_the_database():
+    prescribe(1, "first", ("Amoxicillin", "500mg"))
+    structured_db._prescriptions_by_patient.clear()
+    structured_db._prescriptions_by_drug.clear()
+    structured_db._prescription_index_built = False
+    assert [r["ocr_text"] for r in get_prescriptions_for_patient(1)] == ["first"]
+    assert [r["ocr_text"] for r in get_prescriptions_by_drug("amoxicillin")] == ["first"]
+
+
+def test_concurrent_first_calls_index_each_record_once():
+    prescribe(1, "first", ("Amoxicillin", "500mg"))
+    structured_db._prescriptions_by_patient.clear()
+    structured_db._prescription_index_built = False
+    threads = [threading.Thread(target=get_prescriptions_for_patient, args=(1,)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(structured_db._prescriptions_by_patient[1]) == 1
+
+
+def test_active_medications_cutoff_and_latest_per_drug():
+    prescribe(1, "expired", ("Warfarin", "5mg"), days_ago=ACTIVE_MEDICATION_DAYS + 1)
+    prescribe(1, "older", ("Amoxicillin", "250mg"), days_ago=ACTIVE_MEDICATION_DAYS - 1)
+    prescribe(1, "newer", ("amoxicillin", "500mg"), ("Ibuprofen", "200mg"), days_ago=1)
+    active = {drug["drug_name"].lower(): drug["dosage"] for drug in get_active_medications(1)}
+    assert active == {"amoxicillin": "500mg", "ibuprofen": "200mg"}
+
+
+def test_active_medications_exclude_the_prescription_being_checked():
+    prescribe(1, "earlier", ("Metformin", "850mg"), days_ago=5)
+    prescribe(1, "current", ("Amoxicillin", "500mg"))
+    active = get_active_medications(1, exclude_ocr_text="current")
+    assert [drug["drug_name"] for drug in active] == ["Metformin"]
+
+
+def test_with_active_medications_merges_earlier_drugs():
+    info = {"allergies": "Penicillin", "medications": "Aspirin 100mg"}
+    active = [{"drug_name": "Metformin", "dosage": "850mg"}, {"drug_name": "Ibuprofen", "dosage": ""}]
+    merged = with_active_medications(info, active)
+    assert merged["medications"] == "Aspirin 100mg\nFrom previous prescriptions: Metformin 850mg, Ibuprofen"
+    assert merged["allergies"] == "Penicillin" and info["medications"] == "Aspirin 100mg"
+    assert with_active_medications({}, active)["medications"] == "From previous prescriptions: Metformin 850mg, Ibuprofen"
+    assert with_active_medications(info, []) is info
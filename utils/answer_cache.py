@@ -0,0 +1,217 @@
+# utils/answer_cache.py
+"""
+Near-duplicate question cache for chat answers, kept per prescription.
+
+Questions are reduced to word tokens (contractions expanded, stop-words and
+references to "this medication" removed) and compared with a weighted Jaccard
+similarity, computed locally (no API calls). Question words ("what", "how",
+"can", ...) count half as much as content words. Two questions only match if
+they carry the same negations ("not", "no", "without", ...), so "with food"
+and "without food" never share an answer, and if every content word of the
+new question is in the cached one, so an added qualifier ("for a child",
+"two", "pregnant") is always a miss. Questions without content words ("What
+is it?") and questions asked without a prescription are never cached.
+"""
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, FrozenSet, Optional, Set, Tuple
+
+# Minimum similarity (0-1) for two questions to count as the same question
+SIMILARITY_THRESHOLD = 0.75
+# Maximum number of prescriptions kept in the cache (least recently used evicted first)
+MAX_PRESCRIPTIONS = 256
+# Maximum number of answered questions kept per prescription
+MAX_QUESTIONS_PER_PRESCRIPTION = 64
+
+CONTRACTIONS = {
+    "whats": "what is", "hows": "how is", "cant": "can not", "cannot": "can not",
+    "dont": "do not", "doesnt": "does not", "isnt": "is not", "shouldnt": "should not",
+    "wont": "will not", "wouldnt": "would not", "arent": "are not",
+}
+# Words that change the meaning of a question: the negations must be identical to match
+NEGATIONS = {"not", "no", "never", "without", "nor", "none"}
+QUESTION_WORDS = {"what", "how", "when", "why", "which", "who", "where", "can", "should", "will", "would"}
+STOP_WORDS = {
+    "a", "an", "the", "is", "are", "am", "was", "were", "be", "do", "does", "did",
+    "i", "me", "my", "you", "your", "it", "its", "this", "that", "these", "those", "they", "them",
+    "of", "to", "any", "some", "there", "please", "about", "on", "in",
+    "medication", "medications", "medicine", "drug", "drugs", "pill", "pills", "prescription",
+}
+QUESTION_WORD_WEIGHT = 0.5
+
+
+def normalize_question(question: str) -> str:
+    """
+    Lowercase the question, drop punctuation, expand contractions and collapse whitespace.
+    """
+    text = (question or "").lower()
+    text = text.replace("'", "")
+    text = re.sub(r"[^a-z0-9]+", " ", text)
+    return " ".join(CONTRACTIONS.get(word, word) for word in text.split())
+
+
+def _stem(word: str) -> str:
+    """Crude plural stripping so "effect" and "effects" compare equal."""
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def question_signature(normalized: str) -> Tuple[Dict[str, float], FrozenSet[str]]:
+    """
+    (token -> weight, negation words) of a normalized question.
+    """
+    weights = {}
+    negations = set()
+    for word in normalized.split():
+        if word in NEGATIONS:
+            negations.add(word)
+        elif word in QUESTION_WORDS:
+            weights[word] = QUESTION_WORD_WEIGHT
+        elif word not in STOP_WORDS:
+            weights[_stem(word)] = 1.0
+    return weights, frozenset(negations)
+
+
+def content_tokens(signature: Tuple[Dict[str, float], FrozenSet[str]]) -> Set[str]:
+    """Tokens of a question signature other than question words."""
+    weights, _ = signature
+    return {token for token in weights if token not in QUESTION_WORDS}
+
+
+def similarity(a: Tuple[Dict[str, float], FrozenSet[str]],
+               b: Tuple[Dict[str, float], FrozenSet[str]]) -> float:
+    """
+    Weighted Jaccard similarity of two question signatures, 0 if their negations differ.
+    """
+    (weights_a, negations_a), (weights_b, negations_b) = a, b
+    if negations_a != negations_b:
+        return 0.0
+    if not weights_a and not weights_b:
+        return 1.0
+    union = sum(weights_a.values()) + sum(w for t, w in weights_b.items() if t not in weights_a)
+    common = sum(w for t, w in weights_a.items() if t in weights_b)
+    return common / union
+
+
+def prescription_key(extracted_text: Optional[str]) -> str:
+    """
+    Stable cache key for a prescription, based on its extracted text.
+    """
+    return hashlib.sha256((extracted_text or "").encode("utf-8")).hexdigest()
+
+
+class _PrescriptionEntries:
+    """
+    Answered questions for a single prescription with their signatures.
+    """
+
+    def __init__(self):
+        self.questions: "OrderedDict[str, Tuple[Tuple[Dict[str, float], FrozenSet[str]], str]]" = OrderedDict()
+
+    def best_match(self, signature) -> Tuple[Optional[str], float]:
+        """
+        Most similar cached question that has every content token of `signature`.
+        """
+        tokens = content_tokens(signature)
+        best_question, best_score = None, 0.0
+        for question, (cached_signature, _) in self.questions.items():
+            if not tokens <= content_tokens(cached_signature):
+                continue
+            score = similarity(signature, cached_signature)
+            if score > best_score:
+                best_question, best_score = question, score
+        return best_question, best_score
+
+    def add(self, question: str, signature, answer: str) -> int:
+        evicted = 0
+        self.questions.pop(question, None)
+        self.questions[question] = (signature, answer)
+        while len(self.questions) > MAX_QUESTIONS_PER_PRESCRIPTION:
+            self.questions.popitem(last=False)
+            evicted += 1
+        return evicted
+
+
+class AnswerCache:
+    """
+    Per-prescription cache of chat answers, matched on near-duplicate questions.
+    """
+
+    def __init__(self, threshold: float = SIMILARITY_THRESHOLD,
+                 max_prescriptions: int = MAX_PRESCRIPTIONS):
+        self.threshold = threshold
+        self.max_prescriptions = max_prescriptions
+        self._prescriptions: "OrderedDict[str, _PrescriptionEntries]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, question: str, extracted_text: Optional[str]) -> Optional[str]:
+        """
+        Return the cached answer for a near-duplicate question, or None.
+        """
+        signature = question_signature(normalize_question(question))
+        key = prescription_key(extracted_text)
+        with self._lock:
+            entries = self._prescriptions.get(key) if extracted_text else None
+            if entries is not None and content_tokens(signature):
+                self._prescriptions.move_to_end(key)
+                match, score = entries.best_match(signature)
+                if match is not None and score >= self.threshold:
+                    entries.questions.move_to_end(match)
+                    self.hits += 1
+                    return entries.questions[match][1]
+            self.misses += 1
+            return None
+
+    def put(self, question: str, extracted_text: Optional[str], answer: str):
+        """
+        Store the answer given to a question about a prescription.
+        """
+        normalized = normalize_question(question)
+        signature = question_signature(normalized)
+        if not extracted_text or not content_tokens(signature):
+            return
+        key = prescription_key(extracted_text)
+        with self._lock:
+            entries = self._prescriptions.get(key)
+            if entries is None:
+                entries = self._prescriptions[key] = _PrescriptionEntries()
+            self._prescriptions.move_to_end(key)
+            self.evictions += entries.add(normalized, signature, answer)
+            while len(self._prescriptions) > self.max_prescriptions:
+                _, dropped = self._prescriptions.popitem(last=False)
+                self.evictions += len(dropped.questions)
+
+    def clear(self):
+        """Drop all cached answers and reset the counters."""
+        with self._lock:
+            self._prescriptions.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self) -> Dict:
+        """
+        Cache counters for reporting.
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hit_rate, 2),
+                "evictions": self.evictions,
+                "prescriptions": len(self._prescriptions),
+                "questions": sum(len(e.questions) for e in self._prescriptions.values()),
+            }
+
+
+# Shared across Streamlit sessions: patients asking about the same prescription benefit
+answer_cache = AnswerCache()
@@ -1,24 +1,28 @@
 # utils/file_processor.py
-import requests
-from PIL import Image
 import io
 import base64
 from typing import Optional
-import os
 import re
+import threading
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
 from typing import Dict, List
-from dotenv import load_dotenv
 
-load_dotenv()
+from utils.settings import get_settings
 
-# Get API key from environment
-MISTRAL_API_KEY = os.getenv("MISTRAL_API_KEY")
+NO_TEXT_EXTRACTED = "No text could be extracted from the document."
 
 def process_image_with_mistral_ocr(image_file) -> Optional[str]:
     """
     Process image using Mistral OCR API for handwritten text extraction
     """
     try:
+        # Imported here rather than at module level to keep app startup fast
+        import requests
+        from PIL import Image
+
         # Read and encode the image
         image = Image.open(image_file)
         buffered = io.BytesIO()
@@ -30,7 +34,7 @@ def process_image_with_mistral_ocr(image_file) -> Optional[str]:
         
         # Prepare headers with API key
         headers = {
-            "Authorization": f"Bearer {MISTRAL_API_KEY}",
+            "Authorization": f"Bearer {get_settings().mistral_api_key}",
             "Content-Type": "application/json"
         }
         
@@ -56,12 +60,276 @@ def process_image_with_mistral_ocr(image_file) -> Optional[str]:
             extracted_text = result['pages'][0].get('markdown', '').strip()
             return extracted_text
         else:
-            return "No text could be extracted from the document."
+            return NO_TEXT_EXTRACTED
     except Exception as e:
         print(f"OCR processing error: {str(e)}")
         return None
 
-def process_uploaded_file(uploaded_file):
+# --- OCR backends ---
+# Selection policy (settings.ocr_policy): "fallback" (primary, then the others in order),
+# "race" (all at once, first usable result wins) or "local_first" (local engine, remote
+# only if the scan is not clean, see settings.ocr_local_min_confidence).
+# Local text below that confidence is never trusted, whatever the policy.
+
+
+@dataclass(frozen=True)
+class OCRResult:
+    """
+    Text extracted by the OCR router and where it came from
+    """
+    text: Optional[str]
+    # Name of the backend that produced the result (None if no backend ran)
+    backend: Optional[str] = None
+    # 0-100, None if the backend does not report one
+    confidence: Optional[float] = None
+    # False for low-confidence local text: not used for the prescription nor reused
+    trusted: bool = False
+    # Seconds the backend took
+    latency: float = 0.0
+
+
+class OCRBackend(ABC):
+    """
+    Interface for OCR engines: extract(image_file) returns the text or None on failure.
+    """
+    name = "base"
+    is_local = False
+
+    @abstractmethod
+    def extract(self, image_file) -> Optional[str]:
+        ...
+
+    def available(self) -> bool:
+        """
+        Whether the engine's dependencies are installed (cheap, does not run it)
+        """
+        return True
+
+    def extract_with_confidence(self, image_file):
+        """
+        Return (text, confidence 0-100 or None if the engine does not report one)
+        """
+        return self.extract(image_file), None
+
+
+class MistralOCRBackend(OCRBackend):
+    """
+    Remote Mistral OCR API, best on handwriting
+    """
+    name = "mistral"
+
+    def extract(self, image_file) -> Optional[str]:
+        text = process_image_with_mistral_ocr(image_file)
+        return None if text == NO_TEXT_EXTRACTED else text
+
+
+class TesseractOCRBackend(OCRBackend):
+    """
+    Local CPU OCR with Tesseract (optional: needs pytesseract and the tesseract binary)
+    """
+    name = "tesseract"
+    is_local = True
+
+    def available(self) -> bool:
+        import importlib.util
+        import shutil
+
+        return importlib.util.find_spec("pytesseract") is not None and shutil.which("tesseract") is not None
+
+    def extract(self, image_file) -> Optional[str]:
+        text, confidence = self.extract_with_confidence(image_file)
+        return text
+
+    def extract_with_confidence(self, image_file):
+        """
+        Return (text, mean word confidence 0-100), or (None, 0.0) on failure
+        """
+        try:
+            import pytesseract
+            from PIL import Image
+
+            image = Image.open(image_file).convert("L")
+            data = pytesseract.image_to_data(image, output_type=pytesseract.Output.DICT)
+            lines: Dict[tuple, List[str]] = {}
+            confidences = []
+            for i, word in enumerate(data["text"]):
+                conf = float(data["conf"][i])
+                if not word.strip() or conf < 0:
+                    continue
+                key = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+                lines.setdefault(key, []).append(word)
+                confidences.append(conf)
+            if not confidences:
+                return None, 0.0
+            text = "\n".join(" ".join(words) for _, words in sorted(lines.items()))
+            return text, sum(confidences) / len(confidences)
+        except Exception as e:
+            print(f"Tesseract OCR error: {str(e)}")
+            return None, 0.0
+
+
+class OCRRouter:
+    """
+    Runs OCR backends according to a selection policy and tracks per-backend
+    latency and accuracy (from evaluate_json against ground truth).
+    """
+
+    def __init__(self, backends: List[OCRBackend], policy: Optional[str] = None):
+        self.backends = {backend.name: backend for backend in backends}
+        self._policy = policy
+        self._lock = threading.Lock()
+        self._stats = {
+            name: {"calls": 0, "failures": 0, "total_latency": 0.0, "accuracy": []}
+            for name in self.backends
+        }
+
+    def _run(self, name: str, image_bytes: bytes, record: bool = True) -> OCRResult:
+        """Run one backend on its own copy of the image, recording latency unless record is False"""
+        start = time.perf_counter()
+        text, confidence = self.backends[name].extract_with_confidence(io.BytesIO(image_bytes))
+        trusted = bool(text) and (
+            not self.backends[name].is_local
+            or (confidence or 0) >= get_settings().ocr_local_min_confidence
+        )
+        result = OCRResult(text, name, confidence, trusted, time.perf_counter() - start)
+        if record:
+            self._record(result)
+        return result
+
+    def _record(self, result: OCRResult):
+        with self._lock:
+            stats = self._stats[result.backend]
+            stats["calls"] += 1
+            stats["total_latency"] += result.latency
+            stats["failures"] += 0 if result.text else 1
+
+    def extract(self, image_file, policy: Optional[str] = None,
+                local_result: Optional[OCRResult] = None) -> OCRResult:
+        """
+        Extract text from an image with the given (or default) selection policy.
+        The first trusted result wins; otherwise the first untrusted one is returned
+        (trusted=False), or an empty result if every backend failed.
+
+        local_result is a local_result() already computed for this image: under the
+        fallback and local_first policies it stands in for running that backend again.
+        """
+        policy = policy or self._policy or get_settings().ocr_policy
+        image_bytes = image_file.read()
+        image_file.seek(0)
+        names = list(self.backends)
+        done = {local_result.backend: local_result} if local_result else {}
+
+        if policy == "race":
+            return self._race(names, image_bytes)
+        if policy == "local_first":
+            local = [name for name in names if self.backends[name].is_local]
+            remote = [name for name in names if not self.backends[name].is_local]
+            return self._fallback(local + remote, image_bytes, done)
+        return self._fallback(names, image_bytes, done)
+
+    def local_result(self, image_file) -> Optional[OCRResult]:
+        """
+        Result of the first available local backend, or None if there is none.
+        Not recorded in the backend stats until extract() uses it.
+        """
+        image_bytes = image_file.read()
+        image_file.seek(0)
+        for name, backend in self.backends.items():
+            if backend.is_local and backend.available():
+                return self._run(name, image_bytes, record=False)
+        return None
+
+    def local_available(self) -> bool:
+        """
+        Whether a local backend can run (OCR reuse needs one to confirm matches)
+        """
+        return any(backend.is_local and backend.available() for backend in self.backends.values())
+
+    def _fallback(self, names: List[str], image_bytes: bytes,
+                  done: Optional[Dict[str, OCRResult]] = None) -> OCRResult:
+        untrusted = OCRResult(None)
+        for name in names:
+            if done and name in done:
+                result = done[name]
+                self._record(result)
+            else:
+                result = self._run(name, image_bytes)
+            if result.trusted:
+                return result
+            untrusted = untrusted if untrusted.text else result
+        return untrusted
+
+    def _race(self, names: List[str], image_bytes: bytes) -> OCRResult:
+        executor = ThreadPoolExecutor(max_workers=len(names))
+        futures = [executor.submit(self._run, name, image_bytes) for name in names]
+        untrusted = OCRResult(None)
+        try:
+            # A fast low-confidence local result does not win: wait for a trusted one
+            for future in as_completed(futures):
+                result = future.result()
+                if result.trusted:
+                    return result
+                untrusted = untrusted if untrusted.text else result
+            return untrusted
+        finally:
+            # Do not wait for the slower backends; their latency is still recorded
+            executor.shutdown(wait=False)
+
+    def record_accuracy(self, image_file, ground_truth: Dict) -> Dict:
+        """
+        Run every backend on an image with known ground truth and record its accuracy
+        (mean of the evaluate_json field checks and drugs F1).
+
+        Returns:
+            dict: backend name -> accuracy for this image
+        """
+        from evalmetrics.evaluations import evaluate_json
+
+        image_bytes = image_file.read()
+        image_file.seek(0)
+        scores = {}
+        for name in self.backends:
+            text = self._run(name, image_bytes).text
+            result = evaluate_json(format_ocr_to_json(text or ""), ground_truth)
+            accuracy = (
+                result["patient_name_correct"] + result["doctor_name_correct"]
+                + result["date_correct"] + result["drugs_f1"]
+            ) / 4
+            with self._lock:
+                self._stats[name]["accuracy"].append(accuracy)
+            scores[name] = round(accuracy, 2)
+        return scores
+
+    def stats(self) -> Dict:
+        """
+        Per-backend call counts, failures, mean latency (s) and mean accuracy
+        """
+        with self._lock:
+            report = {}
+            for name, stats in self._stats.items():
+                report[name] = {
+                    "calls": stats["calls"],
+                    "failures": stats["failures"],
+                    "mean_latency": round(stats["total_latency"] / stats["calls"], 3) if stats["calls"] else None,
+                    "mean_accuracy": round(sum(stats["accuracy"]) / len(stats["accuracy"]), 2) if stats["accuracy"] else None,
+                }
+            return report
+
+    def choose_backend(self, min_accuracy: float = 0.9) -> Optional[str]:
+        """
+        Fastest backend whose measured accuracy reaches min_accuracy, or None if none qualifies yet
+        """
+        candidates = [
+            (stats["mean_latency"], name) for name, stats in self.stats().items()
+            if stats["mean_accuracy"] is not None and stats["mean_accuracy"] >= min_accuracy
+            and stats["mean_latency"] is not None
+        ]
+        return min(candidates)[1] if candidates else None
+
+
+ocr_router = OCRRouter([MistralOCRBackend(), TesseractOCRBackend()])
+
+def process_uploaded_file(uploaded_file, policy: Optional[str] = None, patient_id: Optional[int] = None):
     """
     Main function to handle different file types
     """
@@ -69,9 +337,28 @@ def process_uploaded_file(uploaded_file):
     
     try:
         if file_type in ["image/jpeg", "image/jpg", "image/png"]:
-            # Process image with OCR
-            extracted_text = process_image_with_mistral_ocr(uploaded_file)
-            return extracted_text or "Could not extract text from image"
+            from utils.ocr_reuse import image_hashes, ocr_reuse_index
+
+            # Reuse the OCR of an earlier photo of the same prescription for this patient
+            hashes = image_hashes(uploaded_file)
+            candidates = ocr_reuse_index.candidates(hashes, patient_id)
+            local_result = None
+            if candidates and ocr_router.local_available():
+                # Local OCR only runs to confirm a candidate; extract() reuses its result
+                local_result = ocr_router.local_result(uploaded_file)
+                cached_text = ocr_reuse_index.confirm(candidates, hashes, local_result and local_result.text)
+                if cached_text:
+                    print(f"Reusing OCR of a near-duplicate image ({ocr_reuse_index.api_calls_avoided} API calls avoided)")
+                    return cached_text
+            # Process image with the OCR backends
+            result = ocr_router.extract(uploaded_file, policy, local_result)
+            if not result.trusted:
+                if result.text:
+                    print(f"Discarding low-confidence OCR from {result.backend} ({result.confidence})")
+                return "Could not extract text from image"
+            print(f"OCR by {result.backend} (confidence {result.confidence})")
+            ocr_reuse_index.add(hashes, result.text, patient_id)
+            return result.text
         else:
             return f"File type {file_type} will be supported soon."
     except Exception as e:
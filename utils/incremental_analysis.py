@@ -0,0 +1,101 @@
+# utils/incremental_analysis.py
+"""
+Fingerprint-driven re-analysis of a prescription.
+
+Each analysis result is stored with a fingerprint of the exact inputs it was
+computed from. When the prescription text or the patient information changes,
+only the analyses whose inputs changed are sent to the LLM again.
+"""
+import hashlib
+import json
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from utils.llm_agent import (
+    fallback_summary,
+    format_prescription_with_llm,
+    analyze_personal_allergies_with_llm,
+    analyze_personal_preexistingconditions_with_llm,
+    analyze_personal_drug_interactions_with_llm,
+)
+
+# name -> (label, analysis function, inputs taken from (extracted_text, patient info))
+# Names match the st.session_state fields the results are displayed from.
+ANALYSES = {
+    "formatted_summary": (
+        "prescription",
+        format_prescription_with_llm,
+        lambda text, info: (text,),
+    ),
+    "formatted_allergy_summary": (
+        "allergies",
+        analyze_personal_allergies_with_llm,
+        lambda text, info: (text, info.get("allergies", "")),
+    ),
+    "formatted_preexist_summary": (
+        "pre existing conditions",
+        analyze_personal_preexistingconditions_with_llm,
+        lambda text, info: (text, info.get("conditions", "")),
+    ),
+    "formatted_drug_interactions_summary": (
+        "drug interactions",
+        analyze_personal_drug_interactions_with_llm,
+        lambda text, info: (text, info.get("medications", "")),
+    ),
+}
+
+
+# A failed analysis (LLM error) is retried after this delay, doubled on each failed attempt
+RETRY_AFTER_SECONDS = 60
+MAX_RETRY_AFTER_SECONDS = 3600
+
+
+def fingerprint(*inputs) -> str:
+    """
+    Stable hash of an analysis' inputs.
+    """
+    payload = json.dumps(inputs, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def update_analyses(extracted_text: str, info: Dict, stored: Optional[Dict],
+                    on_recompute: Optional[Callable[[str], None]] = None,
+                    now: Optional[float] = None) -> Tuple[Dict, List[str]]:
+    """
+    Bring stored analysis results up to date with the current inputs.
+
+    Args:
+        extracted_text (str): OCR text of the current prescription.
+        info (dict): Patient information (allergies, conditions, medications).
+        stored (dict): Previous results, {name: {"fingerprint": ..., "result": ...}}; failed
+            entries also carry "failed", "attempts" and "retry_at".
+        on_recompute (callable): Called with the analysis label before it is recomputed.
+        now (float): Current time (epoch seconds), defaults to time.time().
+
+    Returns:
+        tuple: (up-to-date results in the same shape as `stored`, names that were recomputed)
+    """
+    stored = stored or {}
+    now = time.time() if now is None else now
+    results = {}
+    recomputed = []
+    for name, (label, analyze, get_inputs) in ANALYSES.items():
+        inputs = get_inputs(extracted_text, info)
+        fp = fingerprint(*inputs)
+        previous = stored.get(name)
+        same_inputs = previous is not None and previous.get("fingerprint") == fp
+        if same_inputs and (not previous.get("failed") or now < previous.get("retry_at", 0)):
+            results[name] = previous
+            continue
+        if on_recompute:
+            on_recompute(label)
+        result = analyze(*inputs)
+        entry = {"fingerprint": fp, "result": result}
+        if result == fallback_summary(extracted_text):
+            # The LLM call failed and returned the raw-text fallback: back off before retrying
+            attempts = previous.get("attempts", 0) + 1 if same_inputs else 1
+            delay = min(RETRY_AFTER_SECONDS * 2 ** (attempts - 1), MAX_RETRY_AFTER_SECONDS)
+            entry.update(failed=True, attempts=attempts, retry_at=now + delay)
+        results[name] = entry
+        recomputed.append(name)
+    return results, recomputed
@@ -1,24 +1,41 @@
 # utils/llm_agent.py
-from langchain_openai import ChatOpenAI
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import StrOutputParser
-import os
-from dotenv import load_dotenv
+from utils.settings import get_settings
 
-load_dotenv()
+# Fixed replies from analyze_with_llm; they do not depend on the prescription so are never cached
+LLM_ERROR_RESPONSE = "I apologize, I'm having trouble analyzing that right now. Please try again."
+OFFTOPIC_RESPONSE = "I'm designed to help with healthcare-related questions about your prescriptions and medical needs. Please ask me about medications, symptoms, or your health information."
+
+# langchain is imported on first use rather than at module import to keep app startup fast
+def _chat_openai(**kwargs):
+    from langchain_openai import ChatOpenAI
+    return ChatOpenAI(**kwargs)
+
+def _chat_prompt_template(messages):
+    from langchain_core.prompts import ChatPromptTemplate
+    return ChatPromptTemplate.from_messages(messages)
+
+def _str_output_parser():
+    from langchain_core.output_parsers import StrOutputParser
+    return StrOutputParser()
+
+def fallback_summary(extracted_text):
+    """
+    Raw-text summary returned by the formatting/analysis functions when the LLM fails
+    """
+    return f"**Extracted Text:**\n{extracted_text}"
 
 def is_healthcare_related(question):
     """
     Classify if a question is healthcare-related before processing
     """
     try:
-        llm = ChatOpenAI(
+        llm = _chat_openai(
             model="gpt-4o-mini",
-            api_key=os.getenv("OPENAI_API_KEY"),
+            api_key=get_settings().openai_api_key,
             temperature=0.0
         )
         
-        prompt_template = ChatPromptTemplate.from_messages([
+        prompt_template = _chat_prompt_template([
             ("system", """You are a healthcare topic classifier. Determine if the user's question is related to healthcare, medicine, prescriptions, or patient health.
 
 RETURN ONLY ONE WORD: "healthcare" or "offtopic"
@@ -36,7 +53,7 @@ User: Can this drug cause drowsiness? -> healthcare"""),
             ("human", "User question: {question}")
         ])
         
-        chain = prompt_template | llm | StrOutputParser()
+        chain = prompt_template | llm | _str_output_parser()
         classification = chain.invoke({"question": question})
         
         return classification.strip().lower() == "healthcare"
@@ -62,17 +79,17 @@ def analyze_with_llm(user_question, extracted_text):
     
         # FIRST: Check if question is healthcare-related
         if not is_healthcare_related(user_question):
-            return "I'm designed to help with healthcare-related questions about your prescriptions and medical needs. Please ask me about medications, symptoms, or your health information."
+            return OFFTOPIC_RESPONSE
         
         # Proceed with healthcare questions
-        llm = ChatOpenAI(
+        llm = _chat_openai(
             model="gpt-4o-mini",
-            api_key=os.getenv("OPENAI_API_KEY"),
+            api_key=get_settings().openai_api_key,
             temperature=0.1
         )
         
         # Create a prompt template for medical analysis
-        prompt_template = ChatPromptTemplate.from_messages([
+        prompt_template = _chat_prompt_template([
             ("system", """You are a helpful medical assistant. Analyze the extracted prescription text and provide helpful information to the patient.
 
 EXTRACTED PRESCRIPTION TEXT:
@@ -83,7 +100,7 @@ Please help the patient understand this prescription. Be clear, concise, and med
         ])
         
         # Create chain
-        chain = prompt_template | llm | StrOutputParser()
+        chain = prompt_template | llm | _str_output_parser()
         
         # Invoke the chain
         response = chain.invoke({
@@ -95,21 +112,21 @@ Please help the patient understand this prescription. Be clear, concise, and med
         
     except Exception as e:
         print(f"LLM analysis error: {str(e)}")
-        return "I apologize, I'm having trouble analyzing that right now. Please try again."
+        return LLM_ERROR_RESPONSE
 
 def format_prescription_with_llm(extracted_text):
     """
     Automatically format extracted prescription text into structured, readable summary
     """
     try:
-        llm = ChatOpenAI(
+        llm = _chat_openai(
             model="gpt-4o-mini",
-            api_key=os.getenv("OPENAI_API_KEY"),
+            api_key=get_settings().openai_api_key,
             temperature=0.0  # Zero temperature for consistent formatting
         )
         
         # Detailed prompt for structured formatting
-        prompt_template = ChatPromptTemplate.from_messages([
+        prompt_template = _chat_prompt_template([
             ("system", """You are a medical transcription expert. Format the extracted prescription text into a clean, structured, patient-friendly summary.
 
 ORGANIZE THE INFORMATION AS FOLLOWS:
@@ -146,7 +163,7 @@ EXTRACTED TEXT:
 {extracted_text}""")
         ])
         
-        chain = prompt_template | llm | StrOutputParser()
+        chain = prompt_template | llm | _str_output_parser()
         formatted_output = chain.invoke({"extracted_text": extracted_text})
         
         return formatted_output
@@ -154,7 +171,7 @@ EXTRACTED TEXT:
     except Exception as e:
         print(f"Prescription formatting error: {str(e)}")
         # Fallback to raw text if LLM fails
-        return f"**Extracted Text:**\n{extracted_text}"
+        return fallback_summary(extracted_text)
     
 
 
@@ -163,14 +180,14 @@ def analyze_personal_allergies_with_llm(extracted_text, allergies):
     Personalize the alerts on the patients allergies into structured, readable summary
     """
     try:
-        llm = ChatOpenAI(
+        llm = _chat_openai(
             model="gpt-4o-mini",
-            api_key=os.getenv("OPENAI_API_KEY"),
+            api_key=get_settings().openai_api_key,
             temperature=0.0  # Zero temperature for consistent formatting
         )
         
         # Detailed prompt for structured formatting
-        prompt_template = ChatPromptTemplate.from_messages([
+        prompt_template = _chat_prompt_template([
             ("system", """You are a medical expert. Analyze the extracted prescription text in order to provide information about the interactions with the allergies the patient has.
 
              The patient has the following allergies: {allergies}           
@@ -206,7 +223,7 @@ EXTRACTED TEXT:
 {extracted_text}. """)
         ])
         
-        chain = prompt_template | llm | StrOutputParser()
+        chain = prompt_template | llm | _str_output_parser()
         formatted_output = chain.invoke({"extracted_text": extracted_text, "allergies":allergies})
         
         return formatted_output
@@ -214,7 +231,7 @@ EXTRACTED TEXT:
     except Exception as e:
         print(f"Prescription formatting error: {str(e)}")
         # Fallback to raw text if LLM fails
-        return f"**Extracted Text:**\n{extracted_text}"
+        return fallback_summary(extracted_text)
     
 
 
@@ -223,14 +240,14 @@ def analyze_personal_preexistingconditions_with_llm(extracted_text, preexistingc
     Personalize the alerts on the patients allergies into structured, readable summary
     """
     try:
-        llm = ChatOpenAI(
+        llm = _chat_openai(
             model="gpt-4o-mini",
-            api_key=os.getenv("OPENAI_API_KEY"),
+            api_key=get_settings().openai_api_key,
             temperature=0.0  # Zero temperature for consistent formatting
         )
         
         # Detailed prompt for structured formatting
-        prompt_template = ChatPromptTemplate.from_messages([
+        prompt_template = _chat_prompt_template([
             ("system", """You are a medical expert. Analyze the extracted prescription text in order to provide information about the interactions with the pre existing conditions the patient has.
 
 The patient has the following pre exising conditions: {preexistingconditions}           
@@ -266,7 +283,7 @@ EXTRACTED TEXT:
 {extracted_text}. """)
         ])
         
-        chain = prompt_template | llm | StrOutputParser()
+        chain = prompt_template | llm | _str_output_parser()
         formatted_output = chain.invoke({"extracted_text": extracted_text, "preexistingconditions":preexistingconditions})
         
         return formatted_output
@@ -274,7 +291,7 @@ EXTRACTED TEXT:
     except Exception as e:
         print(f"Prescription formatting error: {str(e)}")
         # Fallback to raw text if LLM fails
-        return f"**Extracted Text:**\n{extracted_text}"
+        return fallback_summary(extracted_text)
     
 
 
@@ -283,14 +300,14 @@ def analyze_personal_drug_interactions_with_llm(extracted_text, drug_interaction
     Personalize the alerts on the patients allergies into structured, readable summary
     """
     try:
-        llm = ChatOpenAI(
+        llm = _chat_openai(
             model="gpt-4o-mini",
-            api_key=os.getenv("OPENAI_API_KEY"),
+            api_key=get_settings().openai_api_key,
             temperature=0.0  # Zero temperature for consistent formatting
         )
         
         # Detailed prompt for structured formatting
-        prompt_template = ChatPromptTemplate.from_messages([
+        prompt_template = _chat_prompt_template([
             ("system", """You are a medical expert. Analyze the extracted prescription text and provide information about the interactions with the current drugs the patient takes.
 
 **Drug Interactions Alerts**
@@ -335,7 +352,7 @@ EXTRACTED TEXT:
 {extracted_text}. """)
         ])
         
-        chain = prompt_template | llm | StrOutputParser()
+        chain = prompt_template | llm | _str_output_parser()
         formatted_output = chain.invoke({"extracted_text": extracted_text, "drug_interactions":drug_interactions})
         
         return formatted_output
@@ -343,5 +360,5 @@ EXTRACTED TEXT:
     except Exception as e:
         print(f"Prescription formatting error: {str(e)}")
         # Fallback to raw text if LLM fails
-        return f"**Extracted Text:**\n{extracted_text}"
+        return fallback_summary(extracted_text)
     
\ No newline at end of file
@@ -0,0 +1,262 @@
+# utils/ocr_reuse.py
+"""
+Reuse OCR results for re-photographed prescriptions.
+
+Each uploaded image gets a 64-bit difference hash (dHash), stored in a
+BK-tree per patient for Hamming-distance lookups. The dHash only captures the
+page layout, so two prescriptions written on the same clinic template look
+alike to it. A candidate is therefore confirmed on content, twice:
+
+- both images are reduced to an aligned ink map (the page content cropped to
+  its bounding box, binarized) and compared block by block; any block with
+  text present in one image but not in the other rejects the match;
+- the numbers (doses, dates, quantities) read from the new image by a local
+  OCR backend must be the ones in the stored OCR text, since a one-digit
+  change is too small for the ink map.
+
+Local OCR only runs when the dHash finds candidates; without a local OCR
+backend nothing is reused. Reuse never crosses patients.
+"""
+import base64
+import re
+import threading
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+from utils.structured_db import add_ocr_hash, get_ocr_hashes
+
+# Maximum dHash Hamming distance (out of 64 bits) for a candidate match
+DHASH_THRESHOLD = 8
+# Size of the ink map used to confirm a candidate on content
+INK_MAP_SIZE = (480, 600)
+# Side of the square blocks the ink maps are compared in
+INK_BLOCK_SIZE = 16
+# Maximum ink pixels in any block of one image with no ink nearby in the other
+MAX_UNMATCHED_INK = 24
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def _open_grayscale(image_file):
+    from PIL import Image, ImageOps
+
+    image = ImageOps.exif_transpose(Image.open(image_file)).convert("L")
+    image_file.seek(0)
+    return image
+
+
+def dhash(image_file) -> int:
+    """
+    64-bit difference hash: compares horizontally adjacent pixels of a 9x8 thumbnail.
+    """
+    from PIL import Image
+
+    pixels = list(_open_grayscale(image_file).resize((9, 8), Image.LANCZOS).tobytes())
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            right = pixels[row * 9 + col + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+
+def _otsu_threshold(histogram: List[int]) -> int:
+    """Gray level that best separates ink from paper."""
+    count = sum(histogram)
+    total = sum(level * n for level, n in enumerate(histogram))
+    background_sum = background_count = 0
+    best_variance, threshold = 0.0, 128
+    for level, n in enumerate(histogram):
+        background_count += n
+        foreground_count = count - background_count
+        if not background_count:
+            continue
+        if not foreground_count:
+            break
+        background_sum += level * n
+        mean_dark = background_sum / background_count
+        mean_light = (total - background_sum) / foreground_count
+        variance = background_count * foreground_count * (mean_dark - mean_light) ** 2
+        if variance > best_variance:
+            best_variance, threshold = variance, level
+    return threshold
+
+
+def ink_map(image_file):
+    """
+    Binary ink map of the page content: cropped to the ink bounding box (so framing
+    does not matter), resized to INK_MAP_SIZE and thresholded. Returns a mode "L" image, ink = 255.
+    """
+    from PIL import Image, ImageOps
+
+    image = ImageOps.autocontrast(_open_grayscale(image_file), cutoff=1)
+    threshold = _otsu_threshold(image.histogram())
+    bbox = image.point(lambda p: 255 if p <= threshold else 0).getbbox()
+    if bbox:
+        image = image.crop(bbox)
+    image = image.resize(INK_MAP_SIZE, Image.LANCZOS)
+    threshold = _otsu_threshold(image.histogram())
+    return image.point(lambda p: 255 if p <= threshold else 0)
+
+
+def encode_ink_map(image) -> str:
+    return base64.b64encode(zlib.compress(image.convert("1").tobytes())).decode()
+
+
+def decode_ink_map(encoded: str):
+    from PIL import Image
+
+    return Image.frombytes("1", INK_MAP_SIZE, zlib.decompress(base64.b64decode(encoded))).convert("L")
+
+
+def unmatched_ink(a, b) -> int:
+    """
+    Largest number of ink pixels, in any block, that one map has with no ink within
+    one pixel in the other map (checked both ways).
+    """
+    from PIL import Image, ImageChops, ImageFilter
+
+    worst = 0
+    blocks = (INK_MAP_SIZE[0] // INK_BLOCK_SIZE, INK_MAP_SIZE[1] // INK_BLOCK_SIZE)
+    for first, second in ((a, b), (b, a)):
+        missing = ImageChops.subtract(first, second.filter(ImageFilter.MaxFilter(3)))
+        # BOX resize averages each block, so the maximum is the densest block of missing ink
+        densest = missing.resize(blocks, Image.BOX).getextrema()[1]
+        worst = max(worst, round(densest / 255 * INK_BLOCK_SIZE * INK_BLOCK_SIZE))
+    return worst
+
+
+def numbers(text: str) -> List[str]:
+    """Sorted distinct numbers in an OCR text ("500mg, 2024-08-15" -> ["2024-08-15", "500"])."""
+    return sorted(set(re.findall(r"\d+(?:[.,/:-]\d+)*", text or "")))
+
+
+class BKTree:
+    """
+    Burkhard-Keller tree over integer hashes with Hamming distance.
+    """
+
+    def __init__(self):
+        # node: [hash, values, {distance: child node}]
+        self._root = None
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def add(self, key: int, value):
+        self._size += 1
+        if self._root is None:
+            self._root = [key, [value], {}]
+            return
+        node = self._root
+        while True:
+            distance = hamming(key, node[0])
+            if distance == 0:
+                node[1].append(value)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [key, [value], {}]
+                return
+            node = child
+
+    def search(self, key: int, max_distance: int) -> List[Tuple[int, object]]:
+        """
+        (distance, value) pairs within max_distance of key, closest first.
+        """
+        results = []
+        stack = [self._root] if self._root is not None else []
+        while stack:
+            node = stack.pop()
+            distance = hamming(key, node[0])
+            if distance <= max_distance:
+                results.extend((distance, value) for value in node[1])
+            # Triangle inequality: only children at distance within +-max_distance can match
+            for child_distance, child in node[2].items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    stack.append(child)
+        results.sort(key=lambda r: r[0])
+        return results
+
+
+class OCRReuseIndex:
+    """
+    Perceptual-hash index of previously OCR'd images, per patient, persisted in structured_db.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._trees: Optional[Dict[int, BKTree]] = None
+        self.lookups = 0
+        self.api_calls_avoided = 0
+
+    def _get_trees(self) -> Dict[int, BKTree]:
+        if self._trees is None:
+            trees = {}
+            for record in get_ocr_hashes():
+                if record.get("patient_id") is None or "ink_map" not in record:
+                    continue  # cannot be confirmed on content or scoped to a patient
+                trees.setdefault(record["patient_id"], BKTree()).add(
+                    int(record["dhash"], 16), (record["ink_map"], record["ocr_text"])
+                )
+            self._trees = trees
+        return self._trees
+
+    def candidates(self, hashes: Tuple, patient_id: Optional[int]) -> List[Tuple[str, str]]:
+        """
+        (encoded ink map, OCR text) of this patient's stored images whose dHash is close,
+        closest first. Cheap: call it before running local OCR for confirm().
+        """
+        if patient_id is None:
+            return []
+        with self._lock:
+            self.lookups += 1
+            tree = self._get_trees().get(patient_id)
+            return [value for _, value in tree.search(hashes[0], DHASH_THRESHOLD)] if tree else []
+
+    def confirm(self, candidates: List[Tuple[str, str]], hashes: Tuple,
+                local_text: Optional[str]) -> Optional[str]:
+        """
+        OCR text of the candidate that is the same prescription as the new image, or None.
+
+        Args:
+            candidates (list): candidates() of the new image.
+            hashes (tuple): image_hashes() of the new image.
+            local_text (str): Text read from the new image by a local OCR backend.
+        """
+        if not local_text:
+            return None
+        image_numbers = numbers(local_text)
+        for candidate_ink_map, ocr_text in candidates:
+            if numbers(ocr_text) != image_numbers:
+                continue
+            if unmatched_ink(hashes[1], decode_ink_map(candidate_ink_map)) <= MAX_UNMATCHED_INK:
+                with self._lock:
+                    self.api_calls_avoided += 1
+                return ocr_text
+        return None
+
+    def add(self, hashes: Tuple, ocr_text: str, patient_id: Optional[int]):
+        if patient_id is None:
+            return
+        d_hash, image_ink_map = hashes
+        encoded = encode_ink_map(image_ink_map)
+        with self._lock:
+            self._get_trees().setdefault(patient_id, BKTree()).add(d_hash, (encoded, ocr_text))
+            add_ocr_hash(patient_id, f"{d_hash:016x}", encoded, ocr_text)
+
+    def stats(self) -> Dict:
+        return {"lookups": self.lookups, "api_calls_avoided": self.api_calls_avoided}
+
+
+def image_hashes(image_file) -> Tuple:
+    """(dHash, ink map) of an uploaded image."""
+    return dhash(image_file), ink_map(image_file)
+
+
+# Shared across Streamlit sessions, but lookups are scoped to one patient
+ocr_reuse_index = OCRReuseIndex()
@@ -0,0 +1,225 @@
+# utils/patient_index.py
+"""
+In-memory patient name index for the patient search box.
+
+Prefix matches come from a sorted key array (a flattened prefix trie: all
+keys sharing a prefix are contiguous, so a prefix lookup is two bisects).
+Typo-tolerant matches come from rapidfuzz, run word by word against the
+distinct name words that share the query word's first or second letter
+(so a typo in either one is still found) and whose length can still reach
+the score cutoff, to keep lookups fast on large tables. The last query word
+may be unfinished, so it is also matched against word prefixes of about its
+own length.
+"""
+import math
+import threading
+from bisect import bisect_left, insort
+from typing import Dict, List, Optional, Set, Tuple
+
+# Minimum rapidfuzz score (0-100) for a typo-tolerant match
+FUZZY_SCORE_CUTOFF = 80
+# Longest word prefix indexed for matching an unfinished last query word
+MAX_PREFIX_LENGTH = 10
+
+
+def normalize_name(name: str) -> str:
+    """Lowercase and collapse whitespace."""
+    return " ".join((name or "").lower().split())
+
+
+def _name_keys(name: str) -> Set[str]:
+    """
+    Keys under which a name is indexed: the full name and every word suffix,
+    so "ceg" finds "Armande Cegna".
+    """
+    words = normalize_name(name).split()
+    return {" ".join(words[i:]) for i in range(len(words))}
+
+
+def _candidate_lengths(query_length: int) -> range:
+    """
+    Key lengths for which fuzz.ratio can still reach FUZZY_SCORE_CUTOFF,
+    since ratio <= 200 * min(a, b) / (a + b).
+    """
+    cutoff = FUZZY_SCORE_CUTOFF / 100
+    shortest = math.ceil(query_length * cutoff / (2 - cutoff))
+    longest = math.floor(query_length * (2 - cutoff) / cutoff)
+    return range(max(shortest, 1), longest + 1)
+
+
+def _anchors(text: str) -> List[Tuple[int, str]]:
+    """
+    Bucket anchors of a word or prefix: its first letter and its second letter.
+    """
+    return [(position, text[position]) for position in range(min(len(text), 2))]
+
+
+class PatientNameIndex:
+    """
+    Name -> doc_id index, kept in sync with the patient table.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sorted_keys: List[Tuple[str, int]] = []
+        self._names: Dict[int, str] = {}
+        self._word_ids: Dict[str, Set[int]] = {}
+        # (letter position, letter, word length) -> words, the rapidfuzz candidate sets
+        self._buckets: Dict[Tuple[int, str, int], Dict[str, None]] = {}
+        # (letter position, letter, prefix length) -> proper word prefix -> words,
+        # for the unfinished last query word
+        self._prefix_buckets: Dict[Tuple[int, str, int], Dict[str, Set[str]]] = {}
+        self.built = False
+
+    def __len__(self):
+        return len(self._names)
+
+    def build(self, records):
+        """
+        (Re)build the index from TinyDB documents.
+        """
+        with self._lock:
+            self._sorted_keys = []
+            self._names = {}
+            self._word_ids = {}
+            self._buckets = {}
+            self._prefix_buckets = {}
+            for record in records:
+                self._add(record.doc_id, record.get("name", ""), keep_sorted=False)
+            self._sorted_keys.sort()
+            self.built = True
+
+    def add(self, doc_id: int, name: str):
+        with self._lock:
+            self._add(doc_id, name)
+
+    def update(self, doc_id: int, name: str):
+        with self._lock:
+            self._remove(doc_id)
+            self._add(doc_id, name)
+
+    def remove(self, doc_id: int):
+        with self._lock:
+            self._remove(doc_id)
+
+    def _add(self, doc_id, name, keep_sorted=True):
+        if not normalize_name(name):
+            return
+        self._names[doc_id] = name
+        for key in _name_keys(name):
+            if keep_sorted:
+                insort(self._sorted_keys, (key, doc_id))
+            else:
+                self._sorted_keys.append((key, doc_id))
+        for word in normalize_name(name).split():
+            ids = self._word_ids.setdefault(word, set())
+            if not ids:
+                self._index_word(word)
+            ids.add(doc_id)
+
+    def _index_word(self, word):
+        for position, letter in _anchors(word):
+            self._buckets.setdefault((position, letter, len(word)), {})[word] = None
+        for length in range(1, min(len(word), MAX_PREFIX_LENGTH + 1)):
+            prefix = word[:length]
+            for position, letter in _anchors(prefix):
+                self._prefix_buckets.setdefault((position, letter, length), {}).setdefault(prefix, set()).add(word)
+
+    def _unindex_word(self, word):
+        for position, letter in _anchors(word):
+            self._buckets.get((position, letter, len(word)), {}).pop(word, None)
+        for length in range(1, min(len(word), MAX_PREFIX_LENGTH + 1)):
+            prefix = word[:length]
+            for position, letter in _anchors(prefix):
+                prefixes = self._prefix_buckets.get((position, letter, length), {})
+                words = prefixes.get(prefix)
+                if words is not None:
+                    words.discard(word)
+                    if not words:
+                        del prefixes[prefix]
+
+    def _remove(self, doc_id):
+        name = self._names.pop(doc_id, None)
+        if name is None:
+            return
+        for key in _name_keys(name):
+            i = bisect_left(self._sorted_keys, (key, doc_id))
+            if i < len(self._sorted_keys) and self._sorted_keys[i] == (key, doc_id):
+                del self._sorted_keys[i]
+        for word in normalize_name(name).split():
+            ids = self._word_ids.get(word)
+            if ids is not None:
+                ids.discard(doc_id)
+                if not ids:
+                    del self._word_ids[word]
+                    self._unindex_word(word)
+
+    def search(self, query: str, limit: int = 10) -> List[Tuple[int, str]]:
+        """
+        Return up to `limit` (doc_id, name) pairs: prefix matches first,
+        then typo-tolerant matches.
+        """
+        query = normalize_name(query)
+        if not query:
+            return []
+        with self._lock:
+            found: Dict[int, None] = {}
+            i = bisect_left(self._sorted_keys, (query, -1))
+            while i < len(self._sorted_keys) and len(found) < limit:
+                key, doc_id = self._sorted_keys[i]
+                if not key.startswith(query):
+                    break
+                found.setdefault(doc_id)
+                i += 1
+            if len(found) < limit:
+                for doc_id in self._fuzzy_search(query):
+                    found.setdefault(doc_id)
+            return [(doc_id, self._names[doc_id]) for doc_id in list(found)[:limit]]
+
+    def _fuzzy_search(self, query: str) -> List[int]:
+        """
+        doc_ids whose names contain a close match for every query word,
+        best total score first. The last word also matches close word prefixes.
+        """
+        words = query.split()
+        scores: Optional[Dict[int, float]] = None
+        for i, word in enumerate(words):
+            word_scores = self._word_scores(word, as_prefix=(i == len(words) - 1))
+            if scores is None:
+                scores = word_scores
+            else:
+                scores = {d: s + word_scores[d] for d, s in scores.items() if d in word_scores}
+            if not scores:
+                return []
+        return sorted(scores, key=lambda d: (-scores[d], d))
+
+    def _word_scores(self, word: str, as_prefix: bool) -> Dict[int, float]:
+        """
+        doc_id -> best fuzz.ratio of a name word (or, with as_prefix, a name word prefix) against word
+        """
+        from rapidfuzz import fuzz, process
+
+        def extract(bucket):
+            return process.extract(
+                word, bucket.keys(), scorer=fuzz.ratio,
+                score_cutoff=FUZZY_SCORE_CUTOFF, limit=None
+            )
+
+        matched_words: Dict[str, float] = {}
+        for position, letter in _anchors(word):
+            for length in _candidate_lengths(len(word)):
+                for match, score, _ in extract(self._buckets.get((position, letter, length), {})):
+                    matched_words[match] = max(matched_words.get(match, 0), score)
+                if as_prefix:
+                    prefixes = self._prefix_buckets.get((position, letter, length), {})
+                    for prefix, score, _ in extract(prefixes):
+                        for full_word in prefixes[prefix]:
+                            matched_words[full_word] = max(matched_words.get(full_word, 0), score)
+        word_scores: Dict[int, float] = {}
+        for full_word, score in matched_words.items():
+            for doc_id in self._word_ids[full_word]:
+                word_scores[doc_id] = max(word_scores.get(doc_id, 0), score)
+        return word_scores
+
+    def name_for(self, doc_id: int) -> Optional[str]:
+        return self._names.get(doc_id)
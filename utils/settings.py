@@ -0,0 +1,34 @@
+# utils/settings.py
+"""
+Application settings, read once from the environment (and .env) on first use.
+"""
+import os
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Optional
+
+
+@dataclass(frozen=True)
+class Settings:
+    openai_api_key: Optional[str]
+    mistral_api_key: Optional[str]
+    # OCR backend selection policy: "fallback", "race" or "local_first"
+    ocr_policy: str
+    # Mean Tesseract word confidence (0-100) above which a scan counts as clean printed text
+    ocr_local_min_confidence: float
+
+
+@lru_cache(maxsize=None)
+def get_settings() -> Settings:
+    """
+    Load .env into the environment and build the settings (only once per process).
+    """
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    return Settings(
+        openai_api_key=os.getenv("OPENAI_API_KEY"),
+        mistral_api_key=os.getenv("MISTRAL_API_KEY"),
+        ocr_policy=os.getenv("OCR_POLICY", "fallback"),
+        ocr_local_min_confidence=float(os.getenv("OCR_LOCAL_MIN_CONFIDENCE", "85")),
+    )
@@ -1,32 +1,181 @@
 """
 CRUD operations for patient information using TinyDB.
+
+Prescriptions are kept per patient in an append-only history table.
 """
-from tinydb import TinyDB, Query
+import threading
+from datetime import datetime, timedelta
+from functools import lru_cache
+
+from utils.patient_index import PatientNameIndex
 
 DB_PATH = 'db.json'
-db = TinyDB(DB_PATH)
-Patient = Query()
+name_index = PatientNameIndex()
+
+@lru_cache(maxsize=None)
+def _get_db():
+    """Open the database on first use rather than at import, to keep app startup fast."""
+    from tinydb import TinyDB
+    return TinyDB(DB_PATH)
+
+def _patient_query():
+    from tinydb import Query
+    return Query()
+
+def _prescriptions():
+    return _get_db().table('prescriptions')
+
+def _ocr_hashes():
+    return _get_db().table('ocr_hashes')
+
+# Drugs prescribed within this many days count as active medications
+ACTIVE_MEDICATION_DAYS = 90
+# In-memory indexes over the prescription history: patient_id -> doc_ids, drug name -> doc_ids.
+# Streamlit sessions run on threads: build, read and update them with the lock held.
+_prescriptions_by_patient = {}
+_prescriptions_by_drug = {}
+_prescription_index_built = False
+_prescription_index_lock = threading.Lock()
+
+def _get_name_index():
+    """Build the patient name index from the database on first use."""
+    if not name_index.built:
+        name_index.build(_get_db().all())
+    return name_index
 
 def add_patient_info(info: dict):
     """Add new patient info to the database."""
-    return db.insert(info)
+    doc_id = _get_db().insert(info)
+    if name_index.built:
+        name_index.add(doc_id, info.get("name", ""))
+    return doc_id
 
 def get_all_patients():
     """Retrieve all patient records."""
-    return db.all()
+    return _get_db().all()
 
 def get_patient_by_age(age):
     """Retrieve patient(s) by age."""
-    return db.search(Patient.age == age)
+    return _get_db().search(_patient_query().age == age)
 
 def update_patient_info(doc_id, updated_info: dict):
     """Update patient info by document ID."""
-    return db.update(updated_info, doc_ids=[doc_id])
+    updated = _get_db().update(updated_info, doc_ids=[doc_id])
+    if name_index.built and "name" in updated_info:
+        name_index.update(doc_id, updated_info["name"])
+    return updated
 
 def delete_patient(doc_id):
     """Delete patient info by document ID."""
-    return db.remove(doc_ids=[doc_id])
+    removed = _get_db().remove(doc_ids=[doc_id])
+    if name_index.built:
+        name_index.remove(doc_id)
+    return removed
 
 def get_patient_by_name(name):
     """Retrieve patient(s) by name."""
-    return db.search(Patient.name == name)
+    return _get_db().search(_patient_query().name == name)
+
+def get_patient_by_id(doc_id):
+    """Retrieve a single patient by document ID."""
+    return _get_db().get(doc_id=doc_id)
+
+def search_patients(query, limit=10):
+    """Typo-tolerant patient name search, returns (doc_id, name) pairs."""
+    return _get_name_index().search(query, limit=limit)
+
+
+def _normalize_drug(drug_name):
+    return " ".join((drug_name or "").lower().split())
+
+def _index_prescription(doc_id, record):
+    _prescriptions_by_patient.setdefault(record["patient_id"], []).append(doc_id)
+    for drug in record.get("structured", {}).get("drugs", []):
+        _prescriptions_by_drug.setdefault(_normalize_drug(drug.get("drug_name")), set()).add(doc_id)
+
+def _build_prescription_index():
+    """Build the prescription indexes from the history table on first use (lock held)."""
+    global _prescription_index_built
+    if not _prescription_index_built:
+        for record in _prescriptions().all():
+            _index_prescription(record.doc_id, record)
+        _prescription_index_built = True
+
+def add_prescription(patient_id, ocr_text, structured: dict, analyses: dict, file_name=None):
+    """
+    Append a prescription to the patient's history. Records are never updated.
+
+    Args:
+        patient_id (int): Patient document ID.
+        ocr_text (str): Raw OCR text.
+        structured (dict): Output of format_ocr_to_json.
+        analyses (dict): Analysis results at the time of upload.
+        file_name (str): Uploaded file name.
+    """
+    record = {
+        "patient_id": patient_id,
+        "file_name": file_name,
+        "ocr_text": ocr_text,
+        "structured": structured,
+        "analyses": analyses,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+    }
+    with _prescription_index_lock:
+        _build_prescription_index()
+        doc_id = _prescriptions().insert(record)
+        _index_prescription(doc_id, record)
+    return doc_id
+
+def get_prescriptions_for_patient(patient_id):
+    """Retrieve a patient's prescriptions, oldest first."""
+    with _prescription_index_lock:
+        _build_prescription_index()
+        doc_ids = list(_prescriptions_by_patient.get(patient_id, []))
+    return _prescriptions().get(doc_ids=doc_ids)
+
+def get_prescriptions_by_drug(drug_name, patient_id=None):
+    """Retrieve prescriptions containing a drug, optionally for one patient only."""
+    with _prescription_index_lock:
+        _build_prescription_index()
+        doc_ids = sorted(_prescriptions_by_drug.get(_normalize_drug(drug_name), ()))
+    records = _prescriptions().get(doc_ids=doc_ids)
+    if patient_id is not None:
+        records = [r for r in records if r["patient_id"] == patient_id]
+    return records
+
+def get_active_medications(patient_id, exclude_ocr_text=None):
+    """
+    Drugs from the patient's prescriptions of the last ACTIVE_MEDICATION_DAYS days,
+    latest prescription per drug. `exclude_ocr_text` skips the prescription being checked.
+    """
+    cutoff = (datetime.now() - timedelta(days=ACTIVE_MEDICATION_DAYS)).isoformat(timespec="seconds")
+    active = {}
+    for record in get_prescriptions_for_patient(patient_id):
+        if record["created_at"] < cutoff or record["ocr_text"] == exclude_ocr_text:
+            continue
+        for drug in record.get("structured", {}).get("drugs", []):
+            active[_normalize_drug(drug.get("drug_name"))] = {**drug, "prescribed_at": record["created_at"]}
+    return list(active.values())
+
+def with_active_medications(info: dict, active_medications: list):
+    """
+    Patient info whose medications also list the drugs from earlier prescriptions,
+    so the drug interactions analysis checks the new prescription against them.
+    """
+    if not active_medications:
+        return info
+    previous = ", ".join(
+        f"{drug.get('drug_name', '')} {drug.get('dosage', '')}".strip() for drug in active_medications
+    )
+    medications = info.get("medications", "")
+    combined = f"{medications}\nFrom previous prescriptions: {previous}" if medications else f"From previous prescriptions: {previous}"
+    return {**info, "medications": combined}
+
+
+def add_ocr_hash(patient_id, dhash, ink_map, ocr_text):
+    """Store the perceptual hash (hex) and encoded ink map of a patient's OCR'd image with its text."""
+    return _ocr_hashes().insert({"patient_id": patient_id, "dhash": dhash, "ink_map": ink_map, "ocr_text": ocr_text})
+
+def get_ocr_hashes():
+    """Retrieve all stored perceptual hashes with their OCR text."""
+    return _ocr_hashes().all()